@@ -3,55 +3,174 @@
 #
 # This file loads all settings from the .env file and centralizes them
 # for the rest of the application.
+#
+# Environment-driven settings are read once, on first access, into a cached
+# 'Settings' instance; 'config.NAME' is forwarded to it via the module-level
+# __getattr__ below, so importing this module has no side effects.
+#
+# Ticket placement values found by detect_placeholders.py are stored in
+# 'detected.json' next to this file and override the layout defaults below.
 # =============================================================================
 import os
+import json
+import hashlib
+import tempfile
+import functools
+import shutil
+import urllib.request
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
-# Load variables from the .env file into the environment
-load_dotenv()
-
-# --- Google Services Configuration ---
-GOOGLE_SA_JSON = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
-
-# --- 1. Google Services Configuration ---
-MAIN_SHEET_LINK = os.getenv("MAIN_SHEET_LINK")
-MAIN_SHEET_NAME = os.getenv("MAIN_SHEET_NAME", "Form_Responses_1")
-DATA_RANGE_INITIAL = f"{MAIN_SHEET_NAME}!A:Z"
-TICKETS_FOLDER_ID = os.getenv("TICKETS_FOLDER_ID")
-QR_CODES_FOLDER_ID = os.getenv("QR_CODES_FOLDER_ID")
-
-# --- 2. Email Configuration ---
-SENDER_EMAIL = os.getenv("SENDER_EMAIL")
-SENDER_APP_PASSWORD = os.getenv("SENDER_APP_PASSWORD")
-
-# --- 3. File Paths & Assets ---
-TICKET_TEMPLATE_EMPTY_PATH = os.getenv("TICKET_TEMPLATE_EMPTY_PATH")
-EMAIL_MESSAGE_PATH = os.getenv("EMAIL_MESSAGE_PATH")
-FONT_PATH = os.getenv("FONT_PATH")
-TESSERACT_CMD_PATH = os.getenv("TESSERACT_CMD_PATH") # Optional
-
-# --- 4. Automation & Sheet Mapping ---
-POLLING_INTERVAL_SECONDS = int(os.getenv("POLLING_INTERVAL_SECONDS", 30))
-COL_NAME = os.getenv("COL_NAME", "Name")
-COL_EMAIL = os.getenv("COL_EMAIL", "Email")
-COL_TICKET_STATUS = os.getenv("COL_TICKET_STATUS", "Ticket Status")
-COL_EMAIL_STATUS = os.getenv("COL_EMAIL_STATUS", "Email Status")
-
-# Add this line to your config.py
-TEXT_COLOR = (17, 17, 17) # This corresponds to the color #111111
+# orjson is optional; it reads and writes bytes directly and is several times
+# faster than the standard library. json_loads/json_dumps below are the shared entry points.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Settings resolved from the environment (and the .env file)."""
+    # --- 1. Google Services Configuration ---
+    GOOGLE_SA_JSON: str | None
+    MAIN_SHEET_LINK: str | None
+    MAIN_SHEET_NAME: str
+    TICKETS_FOLDER_ID: str | None
+    QR_CODES_FOLDER_ID: str | None
+
+    # --- 2. Email Configuration ---
+    SENDER_EMAIL: str | None
+    SENDER_APP_PASSWORD: str | None
+
+    # --- 3. File Paths & Assets ---
+    TICKET_TEMPLATE_EMPTY_PATH: str | None
+    TICKET_TEMPLATE_WITH_TAGS_PATH: str
+    EMAIL_MESSAGE_PATH: str | None
+    FONT_PATH: str # Local path or URL; resolve with localize_remote_file() where the font is used
+    TESSERACT_CMD_PATH: str | None # Optional
+
+    # --- 4. Automation & Sheet Mapping ---
+    POLLING_INTERVAL_SECONDS: int
+    COL_NAME: str
+    COL_EMAIL: str
+    COL_TICKET_STATUS: str
+    COL_EMAIL_STATUS: str
+    WEBHOOK_SECRET: str | None # Optional; enables the POST /webhook wake-up endpoint
+
+    # --- 5. Ticket Layout (from detected.json) ---
+    DETECTED_FONT_SIZE: int
+    DETECTED_QR_CODE_TARGET_SIZE: int
+    DETECTED_NAME_TEXT_Y_POS: int
+    DETECTED_QR_CODE_Y_POS: int
+    SHOULD_DETECT_COORDINATES_ON_STARTUP: bool
+
+    # --- 6. MongoDB Configuration ---
+    MONGO_URI: str | None
+    MONGO_DB_NAME: str | None
+    MONGO_COLLECTION_NAME: str | None
+
+
+def json_loads(raw):
+    """Parses JSON bytes with orjson when available, else the stdlib."""
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+
+def json_dumps(data) -> bytes:
+    """Serializes to indented JSON bytes with orjson when available, else the stdlib. Unknown types (e.g. ObjectId) become strings."""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2, default=str)
+    return json.dumps(data, indent=2, default=str).encode('utf-8')
+
 
-# In your config.py or Render Environment Variables
-FONT_PATH = "https://drive.google.com/file/d/1nbAEoAi7vaGJf4nkx6gjaxwKplzKWFhd/view?usp=sharing"
-DETECTED_FONT_SIZE = 55
-DETECTED_QR_CODE_TARGET_SIZE = 300
+DOWNLOAD_TIMEOUT_SECONDS = 30 # A stalled asset download gives up instead of hanging startup
+DETECTED_LAYOUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "detected.json")
 
-# In your config.py or Render Environment Variables
+
+def load_detected_layout() -> dict:
+    """Reads the placement values written by detect_placeholders.py, if any."""
+    try:
+        with open(DETECTED_LAYOUT_PATH, 'rb') as f:
+            raw = f.read()
+        return json_loads(raw)
+    except (OSError, ValueError):
+        return {}
+
+
+def localize_remote_file(path: str, suffix: str) -> str:
+    """
+    Downloads a remote asset once into the temp directory, keyed by an MD5 of
+    its URL, and returns the local path. Local paths are returned unchanged,
+    and so is the URL if the download fails.
+    """
+    if not path.startswith("http"):
+        return path
+
+    local_path = os.path.join(tempfile.gettempdir(), hashlib.md5(path.encode()).hexdigest() + suffix)
+    if os.path.exists(local_path):
+        return local_path
+
+    download_url = path
+    if "drive.google.com" in path and "/d/" in path:
+        file_id = path.split('/d/')[1].split('/')[0]
+        download_url = f'https://drive.google.com/uc?export=download&id={file_id}'
+    try:
+        with urllib.request.urlopen(download_url, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response, \
+                open(local_path + ".part", 'wb') as f:
+            shutil.copyfileobj(response, f)
+        os.replace(local_path + ".part", local_path)
+        return local_path
+    except OSError as e:
+        print(f"⚠️ Warning: Could not download '{path}': {e}")
+        return path
+
+
+@functools.lru_cache(maxsize=1)
+def settings() -> Settings:
+    """Loads the .env file and builds the settings exactly once."""
+    # Load variables from the .env file into the environment
+    load_dotenv()
+
+    layout = load_detected_layout()
+    return Settings(
+        GOOGLE_SA_JSON=os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON"),
+        MAIN_SHEET_LINK=os.getenv("MAIN_SHEET_LINK"),
+        MAIN_SHEET_NAME=os.getenv("MAIN_SHEET_NAME", "Form_Responses_1"),
+        TICKETS_FOLDER_ID=os.getenv("TICKETS_FOLDER_ID"),
+        QR_CODES_FOLDER_ID=os.getenv("QR_CODES_FOLDER_ID"),
+        SENDER_EMAIL=os.getenv("SENDER_EMAIL"),
+        SENDER_APP_PASSWORD=os.getenv("SENDER_APP_PASSWORD"),
+        TICKET_TEMPLATE_EMPTY_PATH=os.getenv("TICKET_TEMPLATE_EMPTY_PATH"),
+        TICKET_TEMPLATE_WITH_TAGS_PATH=os.getenv("TICKET_TEMPLATE_WITH_TAGS_PATH", "ticket_template_with_tags.png"),
+        EMAIL_MESSAGE_PATH=os.getenv("EMAIL_MESSAGE_PATH"),
+        FONT_PATH=os.getenv("FONT_PATH", "https://drive.google.com/file/d/1nbAEoAi7vaGJf4nkx6gjaxwKplzKWFhd/view?usp=sharing"),
+        TESSERACT_CMD_PATH=os.getenv("TESSERACT_CMD_PATH"),
+        POLLING_INTERVAL_SECONDS=int(os.getenv("POLLING_INTERVAL_SECONDS", 30)),
+        COL_NAME=os.getenv("COL_NAME", "Name"),
+        COL_EMAIL=os.getenv("COL_EMAIL", "Email"),
+        COL_TICKET_STATUS=os.getenv("COL_TICKET_STATUS", "Ticket Status"),
+        COL_EMAIL_STATUS=os.getenv("COL_EMAIL_STATUS", "Email Status"),
+        WEBHOOK_SECRET=os.getenv("WEBHOOK_SECRET"),
+        DETECTED_FONT_SIZE=layout.get("font_size", 55),
+        DETECTED_QR_CODE_TARGET_SIZE=layout.get("qr_size", 300),
+        DETECTED_NAME_TEXT_Y_POS=layout.get("name_y", 887), # The Y-coordinate for the name
+        DETECTED_QR_CODE_Y_POS=layout.get("qr_y", 394),     # The Y-coordinate for the QR code
+        SHOULD_DETECT_COORDINATES_ON_STARTUP=not layout.get("detected", False),
+        MONGO_URI=os.getenv("MONGO_URI"),
+        MONGO_DB_NAME=os.getenv("MONGO_DB_NAME"),
+        MONGO_COLLECTION_NAME=os.getenv("MONGO_COLLECTION_NAME"),
+    )
+
+
+def __getattr__(name):
+    """Forwards 'config.NAME' lookups to the cached Settings instance (PEP 562)."""
+    try:
+        return getattr(settings(), name)
+    except AttributeError:
+        raise AttributeError(f"module 'config' has no attribute '{name}'") from None
+
+
+# --- 5. Ticket Layout (fixed values; the name and QR code are centered horizontally) ---
+TEXT_COLOR = (17, 17, 17) # This corresponds to the color #111111
 DETECTED_NAME_TEXT_X_POS = 51  # The X-coordinate for the name
-DETECTED_NAME_TEXT_Y_POS = 887 # The Y-coordinate for the name
 DETECTED_QR_CODE_X_POS = 184   # The X-coordinate for the QR code
-DETECTED_QR_CODE_Y_POS = 394   # The Y-coordinate for the QR code
-
-# --- 6. MongoDB Configuration ---
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
-MONGO_COLLECTION_NAME = os.getenv("MONGO_COLLECTION_NAME")
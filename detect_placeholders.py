@@ -2,71 +2,312 @@
 # Automated Placeholder Detection & Configuration Utility
 #
 # This script uses OCR to:
-# 1. Find the exact location of '{name}' and '{QR}' tags in a template image.
+# 1. Find the exact location of '{name}' and '{QR}' tags in a template image
+#    (or of solid #FF00FF / #00FF00 marker boxes, which skip OCR entirely).
 # 2. Calculate the optimal Y-positions, font size, and QR code size.
-# 3. Automatically update the 'config.py' file with these new values.
-# 4. Sets 'SHOULD_DETECT_COORDINATES_ON_STARTUP' to False in 'config.py'.
+# 3. Save these values to 'detected.json', which 'config.py' loads.
+# 4. Marks the layout as detected so 'SHOULD_DETECT_COORDINATES_ON_STARTUP'
+#    reads as False from then on.
 #
 # Run this script once to set up your ticket layout automatically.
+# Detection results are cached in '.placeholder_cache.json', keyed by the MD5
+# hash of the template, so an unchanged template never goes through OCR twice.
 # =============================================================================
 
 import os
-from PIL import Image
-import config  # Import config to read paths and write back new values
+import hashlib
+import functools
+import tempfile
+import re
+from PIL import Image, ImageChops, ImageOps
+
+import config  # Import config to read paths and the detected-layout location
+
+# Tesseract's OpenMP threading is slower than a single thread on one small
+# image; this must be set before libtesseract is loaded.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+# Prefer tesserocr: it binds libtesseract in-process, keeps the model loaded
+# between bands and takes PIL images directly. pytesseract is the fallback.
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
 
 try:
     import pytesseract
 except ImportError:
-    print("❌ CRITICAL: 'pytesseract' library not found.")
-    print("Please install it by running: pip install pytesseract")
+    pytesseract = None
+
+if not tesserocr and not pytesseract:
+    print("❌ CRITICAL: Neither 'tesserocr' nor 'pytesseract' library found.")
+    print("Please install one by running: pip install pytesseract")
     exit(1)
 
-def detect_and_update_config():
+PLACEHOLDER_CACHE_PATH = '.placeholder_cache.json'
+TESSERACT_OK_SENTINEL = os.path.join(os.path.dirname(config.DETECTED_LAYOUT_PATH), '.tess_ok')
+OCR_MAX_DIMENSION = 1600 # Longest side (px) of the image handed to Tesseract
+OCR_BAND_HEIGHT = 200    # Height (px) of each horizontal strip scanned for tags
+OCR_BAND_OVERLAP = 80    # Overlap between strips so a tag on a boundary is not split
+PLACEHOLDER_TAGS = ("{name}", "{QR}")
+PLACEHOLDER_TAG_SET = frozenset(PLACEHOLDER_TAGS)
+NAME_MARKER_COLOR = (255, 0, 255) # #FF00FF box may stand in for '{name}'
+QR_MARKER_COLOR = (0, 255, 0)     # #00FF00 box may stand in for '{QR}'
+OCR_WHITELIST = "{}nameQR" # Only the characters that make up the tags
+# LSTM engine, English only, sparse text (no full page-layout analysis)
+OCR_CONFIG = f'--oem 1 --psm 11 -l eng -c tessedit_char_whitelist={OCR_WHITELIST}'
+# An hOCR word element for either tag: bbox x1 y1 x2 y2 followed by the word text
+HOCR_TAG_PATTERN = re.compile(rb"bbox (\d+) (\d+) (\d+) (\d+)[^>]*>(\{name\}|\{QR\})<")
+
+def get_template_hash(path):
+    """Returns the MD5 hex digest of the template image bytes."""
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+def load_placeholder_cache():
+    """Loads the template-hash -> detected settings cache, or an empty dict."""
+    try:
+        with open(PLACEHOLDER_CACHE_PATH, 'rb') as f:
+            return config.json_loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+def write_json_atomic(path, data):
     """
-    Detects placeholders using OCR and programmatically updates the config.py file.
+    Writes JSON to a sibling temp file with a 64KB buffer, then swaps it into
+    place with os.replace so a crash never leaves a truncated file behind.
     """
-    print(f"🔎 Scanning '{config.TICKET_TEMPLATE_WITH_TAGS_PATH}' for placeholders...")
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb', buffering=65536) as f:
+        f.write(config.json_dumps(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
-    # --- Step 1: Validate paths and Tesseract installation ---
-    if not os.path.exists(config.TICKET_TEMPLATE_WITH_TAGS_PATH):
-        print(f"❌ ERROR: Template image not found at '{config.TICKET_TEMPLATE_WITH_TAGS_PATH}'.")
-        return False
+def save_placeholder_cache(cache):
+    """Persists the detection cache so the next run can skip OCR."""
+    try:
+        write_json_atomic(PLACEHOLDER_CACHE_PATH, cache)
+    except OSError as e:
+        print(f"⚠️ Warning: Could not write placeholder cache: {e}")
 
-    if config.TESSERACT_CMD_PATH:
-        pytesseract.pytesseract.tesseract_cmd = config.TESSERACT_CMD_PATH
+@functools.lru_cache(maxsize=1)
+def is_tesseract_available(tesseract_cmd):
+    """
+    Checks that the tesseract binary runs. A successful probe is remembered in
+    a sentinel file holding the command path, so later runs skip the spawn
+    until TESSERACT_CMD_PATH changes.
+    """
+    try:
+        with open(TESSERACT_OK_SENTINEL, 'r') as f:
+            if f.read() == tesseract_cmd:
+                return True
+    except OSError:
+        pass
 
     try:
         # Test Tesseract by getting its version string
         pytesseract.get_tesseract_version()
     except pytesseract.TesseractNotFoundError:
-        print("\n❌ ERROR: Tesseract OCR engine not found.")
-        print("Please ensure Tesseract is installed and the path in 'config.py' is correct.")
         return False
 
-    # --- Step 2: Perform OCR to find placeholders ---
     try:
-        img = Image.open(config.TICKET_TEMPLATE_WITH_TAGS_PATH)
-        data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+        with open(TESSERACT_OK_SENTINEL, 'w') as f:
+            f.write(tesseract_cmd)
+    except OSError:
+        pass
+    return True
+
+def find_color_box(rgb_img, color):
+    """
+    Returns the (left, top, width, height) box of a solid rectangle of exactly
+    'color', or None. Pixels of that colour that do not fill their bounding box
+    (e.g. stray ones in the artwork) are not a marker.
+    """
+    channel_masks = [
+        channel.point(lambda v, target=target: 255 if v == target else 0)
+        for channel, target in zip(rgb_img.split(), color)
+    ]
+    mask = ImageChops.multiply(ImageChops.multiply(channel_masks[0], channel_masks[1]), channel_masks[2])
+    bbox = mask.getbbox()
+    if not bbox:
+        return None
+    left, top, right, bottom = bbox
+    width, height = right - left, bottom - top
+    if mask.histogram()[255] != width * height:
+        return None
+    return (left, top, width, height)
+
+def find_marker_boxes(img):
+    """
+    Finds solid colour markers painted where the tags belong, which is far
+    cheaper than OCR. Returns (name_box, qr_box); either may be None.
+    """
+    rgb_img = img.convert('RGB')
+    return find_color_box(rgb_img, NAME_MARKER_COLOR), find_color_box(rgb_img, QR_MARKER_COLOR)
+
+def otsu_threshold(gray_img):
+    """Computes Otsu's binarization threshold from a grayscale image histogram."""
+    histogram = gray_img.histogram()
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+
+    sum_background = 0
+    weight_background = 0
+    best_threshold, best_variance = 0, 0.0
+    for level, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += level * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+    return best_threshold
+
+def preprocess_for_ocr(img):
+    """
+    Converts the template to a downscaled, binarized grayscale image for OCR.
+    Returns the processed image and the scale factor (processed / original)
+    needed to map detected coordinates back onto the original template.
+    """
+    original_width = img.width
+    gray = ImageOps.autocontrast(img.convert('L'))
+    gray.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.Resampling.LANCZOS)
+    threshold = otsu_threshold(gray)
+    binary = gray.point(lambda v: 255 if v > threshold else 0)
+    return binary, binary.width / original_width
+
+def read_tags_pytesseract(image_path):
+    """Yields (text, box) for each placeholder tag in an image file using the tesseract CLI."""
+    # A path is handed to tesseract as-is; a PIL image would be re-encoded to a temp file
+    hocr = pytesseract.image_to_pdf_or_hocr(image_path, extension='hocr', config=OCR_CONFIG)
+    remaining = set(PLACEHOLDER_TAGS)
+    for match in HOCR_TAG_PATTERN.finditer(hocr):
+        tag = match.group(5).decode()
+        if tag not in remaining:
+            continue
+        x1, y1, x2, y2 = (int(v) for v in match.group(1, 2, 3, 4))
+        yield tag, (x1, y1, x2 - x1, y2 - y1)
+        remaining.discard(tag)
+        if not remaining:
+            break
+
+def read_band_tesserocr(api, img, band_top, band_bottom):
+    """Yields (text, box) for each word in a band using the in-process API."""
+    api.SetRectangle(0, band_top, img.width, band_bottom - band_top)
+    api.Recognize()
+    level = tesserocr.RIL.WORD
+    for word in tesserocr.iterate_level(api.GetIterator(), level):
+        text = word.GetUTF8Text(level)
+        box = word.BoundingBox(level)
+        if text and box:
+            x1, y1, x2, y2 = box
+            yield text.strip(), (x1, y1, x2 - x1, y2 - y1)
+
+def scan_bands(img, read_band):
+    """
+    Scans the image top-to-bottom in overlapping horizontal bands and stops as
+    soon as both tags are found. Returns (name_box, qr_box) as (left, top,
+    width, height) tuples in the coordinates of 'img', or None when missing.
+    """
+    found = {}
+    step = OCR_BAND_HEIGHT - OCR_BAND_OVERLAP
+
+    for band_top in range(0, max(img.height - OCR_BAND_OVERLAP, 1), step):
+        band_bottom = min(band_top + OCR_BAND_HEIGHT, img.height)
+        for text, box in read_band(band_top, band_bottom):
+            # We look for an exact, case-sensitive match for better accuracy;
+            # one set lookup per word, first occurrence of each tag wins
+            if text in PLACEHOLDER_TAG_SET and text not in found:
+                found[text] = box
+
+        if len(found) == len(PLACEHOLDER_TAGS):
+            break
+
+    return found.get("{name}"), found.get("{QR}")
+
+def find_placeholders(img):
+    """
+    Locates the '{name}' and '{QR}' tags with the best available OCR backend.
+    Returns (name_box, qr_box) as (left, top, width, height) tuples.
+    """
+    if tesserocr:
+        with tesserocr.PyTessBaseAPI(lang='eng', psm=tesserocr.PSM.SPARSE_TEXT, oem=tesserocr.OEM.LSTM_ONLY) as api:
+            api.SetVariable("tessedit_char_whitelist", OCR_WHITELIST)
+            api.SetImage(img)
+            return scan_bands(img, lambda top, bottom: read_band_tesserocr(api, img, top, bottom))
+
+    # The CLI pays a process spawn and model load per call, so run it once on
+    # the whole preprocessed image, written to disk a single time.
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = os.path.join(tmp_dir, 'ocr_input.png')
+        img.save(image_path)
+        found = dict(read_tags_pytesseract(image_path))
+    return found.get("{name}"), found.get("{QR}")
+
+def detect_and_update_config():
+    """
+    Detects placeholders (via colour markers or OCR) and saves the placement to detected.json.
+    """
+    print(f"🔎 Scanning '{config.TICKET_TEMPLATE_WITH_TAGS_PATH}' for placeholders...")
+
+    # --- Step 1: Validate paths ---
+    if not os.path.exists(config.TICKET_TEMPLATE_WITH_TAGS_PATH):
+        print(f"❌ ERROR: Template image not found at '{config.TICKET_TEMPLATE_WITH_TAGS_PATH}'.")
+        return False
+
+    # --- Step 1b: Reuse cached results if this exact template was scanned before ---
+    template_hash = get_template_hash(config.TICKET_TEMPLATE_WITH_TAGS_PATH)
+    cache = load_placeholder_cache()
+    cached = cache.get(template_hash)
+    if cached:
+        print(f"⚡ Template unchanged (hash {template_hash[:8]}...). Using cached placement, skipping OCR.")
+        return write_detected_layout(cached['name_y'], cached['font_size'], cached['qr_y'], cached['qr_size'])
+
+    # --- Step 2: Find the placeholders (colour markers first, then OCR) ---
+    try:
+        template = Image.open(config.TICKET_TEMPLATE_WITH_TAGS_PATH)
+        name_box, qr_box = find_marker_boxes(template)
+        scale = 1
+
+        if name_box and qr_box:
+            print("⚡ Found colour markers for both placeholders, skipping OCR.")
+        else:
+            if not tesserocr:
+                if config.TESSERACT_CMD_PATH:
+                    pytesseract.pytesseract.tesseract_cmd = config.TESSERACT_CMD_PATH
+
+                if not is_tesseract_available(pytesseract.pytesseract.tesseract_cmd):
+                    print("\n❌ ERROR: Tesseract OCR engine not found.")
+                    print("Please ensure Tesseract is installed and the path in 'config.py' is correct.")
+                    return False
+
+            img, scale = preprocess_for_ocr(template)
+            name_box, qr_box = find_placeholders(img)
 
         name_coords = None
         qr_coords = None
 
-        for i in range(len(data['text'])):
-            # We look for an exact, case-sensitive match for better accuracy
-            text = data['text'][i].strip()
-            if text == "{name}":
-                x, y, w, h = data['left'][i], data['top'][i], data['width'][i], data['height'][i]
-                name_coords = {'y': y, 'height': h}
-                print(f"✅ Detected '{{name}}' at Y-position: {y}, Height: {h}")
-            elif text == "{QR}":
-                x, y, w, h = data['left'][i], data['top'][i], data['width'][i], data['height'][i]
-                qr_coords = {'y': y, 'width': w}
-                print(f"✅ Detected '{{QR}}' at Y-position: {y}, Width: {w}")
+        # Boxes are (left, top, width, height); only the fields each tag needs are read
+        if name_box:
+            name_coords = {'y': round(name_box[1] / scale), 'height': round(name_box[3] / scale)}
+            print(f"✅ Detected '{{name}}' at Y-position: {name_coords['y']}, Height: {name_coords['height']}")
+        if qr_box:
+            qr_coords = {'y': round(qr_box[1] / scale), 'width': round(qr_box[2] / scale)}
+            print(f"✅ Detected '{{QR}}' at Y-position: {qr_coords['y']}, Width: {qr_coords['width']}")
 
         if not name_coords or not qr_coords:
             print("\n❌ ERROR: Failed to detect both '{name}' and '{QR}' placeholders.")
             print("   - Ensure they are present and clearly visible in the image.")
             print("   - The text must be exactly '{name}' and '{QR}' (case-sensitive).")
+            print("   - Or paint solid #FF00FF / #00FF00 boxes where the name / QR code go.")
             return False
 
         # --- Step 3: Calculate new configuration values ---
@@ -85,35 +326,37 @@ def detect_and_update_config():
         print(f"An unexpected error occurred during image processing: {e}")
         return False
 
-    # --- Step 4: Read config.py and update it programmatically ---
+    cache[template_hash] = {
+        'name_y': new_name_y,
+        'font_size': new_font_size,
+        'qr_y': new_qr_y,
+        'qr_size': new_qr_size,
+    }
+    save_placeholder_cache(cache)
+
+    return write_detected_layout(new_name_y, new_font_size, new_qr_y, new_qr_size)
+
+
+def write_detected_layout(new_name_y, new_font_size, new_qr_y, new_qr_size):
+    """
+    Atomically writes the detected placement values to detected.json.
+    """
+    # --- Step 4: Save the layout next to config.py ---
+    layout = {
+        'name_y': new_name_y,
+        'font_size': new_font_size,
+        'qr_y': new_qr_y,
+        'qr_size': new_qr_size,
+        'detected': True, # Prevents re-detection on every run
+    }
     try:
-        with open('config.py', 'r') as f:
-            config_lines = f.readlines()
-
-        new_config_lines = []
-        for line in config_lines:
-            if line.strip().startswith('DETECTED_NAME_TEXT_Y_POS'):
-                new_config_lines.append(f"DETECTED_NAME_TEXT_Y_POS = {new_name_y}\n")
-            elif line.strip().startswith('DETECTED_FONT_SIZE'):
-                new_config_lines.append(f"DETECTED_FONT_SIZE = {new_font_size}\n")
-            elif line.strip().startswith('DETECTED_QR_CODE_Y_POS'):
-                new_config_lines.append(f"DETECTED_QR_CODE_Y_POS = {new_qr_y}\n")
-            elif line.strip().startswith('DETECTED_QR_CODE_TARGET_SIZE'):
-                new_config_lines.append(f"DETECTED_QR_CODE_TARGET_SIZE = {new_qr_size}\n")
-            elif line.strip().startswith('SHOULD_DETECT_COORDINATES_ON_STARTUP'):
-                # Set the flag to False to prevent re-detection on every run
-                new_config_lines.append("SHOULD_DETECT_COORDINATES_ON_STARTUP = False\n")
-            else:
-                new_config_lines.append(line)
-
-        with open('config.py', 'w') as f:
-            f.writelines(new_config_lines)
-
-        print("\n✅✅✅ Success! Your 'config.py' file has been automatically updated.")
+        write_json_atomic(config.DETECTED_LAYOUT_PATH, layout)
+
+        print(f"\n✅✅✅ Success! Detected layout saved to '{config.DETECTED_LAYOUT_PATH}'.")
         return True
 
     except Exception as e:
-        print(f"\n❌ ERROR: Failed to write the new settings to 'config.py': {e}")
+        print(f"\n❌ ERROR: Failed to write the new settings to '{config.DETECTED_LAYOUT_PATH}': {e}")
         return False
 
 
@@ -10,31 +10,40 @@
 # =============================================================================
 #  Part 1: Imports
 # =============================================================================
+import io
 import os
 import time
 import uuid
-import qrcode
 import smtplib
 import importlib
 import json
+import base64
+import hmac
+import hashlib
+import shutil
+import random
 import requests
 import threading
+import collections
+import functools
+import concurrent.futures
 import http.server
-import socketserver
 from urllib.parse import quote_plus, urlparse
 from PIL import Image, ImageDraw, ImageFont
 
 # Google API client and errors
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaIoBaseUpload
 from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+from google.auth.transport.requests import AuthorizedSession
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 
 
 # Email components
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.mime.image import MIMEImage
+from email.mime.base import MIMEBase
 
 # Custom modules (ensure these files are in the same directory)
 import config
@@ -45,30 +54,88 @@ from mongo_helper import MongoDBClient
 # =============================================================================
 
 # --- Global Application State & Constants ---
-PROCESSED_ENTRIES = set()
 COLUMN_INDICES = {}
-ERROR_LOG = []
+NEW_DATA_EVENT = threading.Event() # Set by the /webhook endpoint to cut the polling sleep short
 MAX_ERROR_LOG_SIZE = 100
-mongo_client = MongoDBClient() # Initialize MongoDB client
+ERROR_LOG = collections.deque(maxlen=MAX_ERROR_LOG_SIZE) # The oldest error drops off once full
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+RESPONSE_CACHE = {}      # path -> (data_version, built_at, etag, body) for /attendees and /unsent
+RESPONSE_CACHE_TTL_SECONDS = 60 # Rebuild cached responses at least this often (catches external writes)
+ROW_WORKERS = 4          # Rows processed at the same time
+IO_WORKERS = 8           # Threads for Drive uploads
+WEB_WORKERS = 16         # Threads serving the status web server
+MAX_WEBHOOK_BODY_BYTES = 64 * 1024 # Larger webhook bodies are rejected unread
+KEEP_ALIVE_TIMEOUT_SECONDS = 5 # Idle keep-alive connections are closed after this, freeing a web worker
+MAX_PENDING_ROWS = 16    # Rows queued on the row pool before the loop waits
+GOOGLE_HTTP_TIMEOUT = 30 # Seconds before a Sheets or Drive request times out
+DOWNLOAD_CHUNK_SIZE = 512 * 1024 # Block size for streaming downloaded assets to disk
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets" # Sheets calls bypass googleapiclient
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+GOOGLE_API_RETRIES = 5   # Retries on 429/5xx, backing off with jittered 2^n second waits
+RECONCILE_INTERVAL_SECONDS = 3600 # How often the whole sheet is re-read instead of just the new rows
+MAX_IDLE_POLL_SECONDS = 300 # Cap for the polling interval, which doubles after each idle poll
+SMTP_IDLE_CHECK_SECONDS = 30 # Idle time after which the SMTP connection is checked with NOOP
+MAX_ATTEMPTS = 3         # Tries per email, with 2^attempt second backoff
+IO_POOL = None           # Created in main()
+PNG_COMPRESS_LEVEL = 1   # zlib level for ticket and QR PNGs (PIL's default is 6)
+QR_VERSION = 3           # Smallest version holding a 36-byte UUID at error correction level L
+QR_MASK_PATTERN = 0      # Fixed mask, skipping the 8-mask penalty search
+_EMAIL_TEMPLATE = None   # Email HTML, set by load_assets()
+_TEMPLATE = None         # Decoded ticket template, set by load_assets()
+_FONT = None             # Ticket font, set by load_assets()
+mongo_client = None      # MongoDBClient, connected in main() so importing this module has no side effects
 
 def log_error(message):
     """Logs an error message to the console and a global list."""
     print(message)
-    if len(ERROR_LOG) >= MAX_ERROR_LOG_SIZE:
-        ERROR_LOG.pop(0) # Remove the oldest error
-    ERROR_LOG.append(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}")
+    ERROR_LOG.append(f"[{time.strftime(TIMESTAMP_FORMAT)}] {message}")
 
 ###
 # --- Web Server Components ---
 ###
 
+def is_valid_webhook_signature(body: bytes, signature: str) -> bool:
+    """Checks the hex HMAC-SHA256 of a webhook body against WEBHOOK_SECRET. Always False if no secret is set."""
+    if not config.WEBHOOK_SECRET:
+        return False
+    expected = hmac.new(config.WEBHOOK_SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest().encode('ascii')
+    # Compared as bytes: compare_digest raises TypeError on non-ASCII str input
+    return hmac.compare_digest(expected, signature.encode('latin-1', errors='replace'))
+
+def wait_for_next_poll(idle_polls: int = 0) -> bool:
+    """
+    Sleeps for the polling interval, doubled for each of 'idle_polls' consecutive
+    polls that found nothing to do (up to MAX_IDLE_POLL_SECONDS). Returns True
+    early when the webhook reports a new submission.
+    """
+    interval = config.POLLING_INTERVAL_SECONDS
+    delay = min(interval * 2 ** min(idle_polls, 10), max(interval, MAX_IDLE_POLL_SECONDS))
+    woken = NEW_DATA_EVENT.wait(delay)
+    if woken:
+        print("🔔 Webhook received. Checking for new data now.")
+    NEW_DATA_EVENT.clear()
+    return woken
+
+def attendee_projection() -> dict:
+    """The attendee fields the API returns, so MongoDB sends back nothing else (not even _id)."""
+    return {"_id": 0, "attendee_id": 1, config.COL_NAME: 1, config.COL_EMAIL: 1,
+            config.COL_TICKET_STATUS: 1, config.COL_EMAIL_STATUS: 1}
+
 class StatusHandler(http.server.SimpleHTTPRequestHandler):
     """A handler for multiple API endpoints for status and data retrieval."""
+    # HTTP/1.1 keeps connections open between requests (e.g. health-check probes); every
+    # response carries a Content-Length, and idle connections are dropped after 'timeout'
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT_SECONDS
+    _status_cache = (0, b'') # (second, encoded status message) shared by all requests
+
     def do_GET(self):
         if self.path == '/':
             self.send_status_response()
         elif self.path == '/errors':
-            self.send_json_response(ERROR_LOG)
+            self.send_json_response(list(ERROR_LOG))
+        elif self.path in ('/attendees', '/unsent') and mongo_client is None:
+            self.send_error(503, "Database not connected yet")
         elif self.path == '/attendees':
             self.send_attendees_response()
         elif self.path == '/unsent':
@@ -76,29 +143,81 @@ class StatusHandler(http.server.SimpleHTTPRequestHandler):
         else:
             self.send_error(404, "Not Found")
 
-    def send_json_response(self, data):
-        """Sends a JSON response."""
+    def do_POST(self):
+        # Form submissions (e.g. an Apps Script onFormSubmit trigger) wake the poller
+        # straight away instead of waiting out the polling interval
+        if self.path != '/webhook':
+            self.send_error(404, "Not Found")
+            return
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            content_length = -1
+        if not 0 <= content_length <= MAX_WEBHOOK_BODY_BYTES:
+            self.send_error(400, "Invalid Content-Length")
+            return
+        body = self.rfile.read(content_length)
+        if not is_valid_webhook_signature(body, self.headers.get('X-Signature', '')):
+            self.send_error(403, "Invalid signature")
+            return
+        NEW_DATA_EVENT.set()
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_body(self, body: bytes, content_type: str, headers: dict | None = None):
+        """Sends a 200 response with the given body and a Content-Length, so the connection can stay open."""
         self.send_response(200)
-        self.send_header("Content-type", "application/json; charset=utf-8")
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data, indent=2).encode('utf-8'))
+        self.wfile.write(body)
+
+    def send_json_response(self, data):
+        """Sends a JSON response."""
+        self.send_body(config.json_dumps(data), "application/json; charset=utf-8")
 
     def send_status_response(self):
         """Sends a simple text status response."""
-        self.send_response(200)
-        self.send_header("Content-type", "text/plain; charset=utf-8")
-        self.end_headers()
-        status_message = f"✅ Event Ticketing System is running.\nLast check: {time.strftime('%Y-%m-%d %H:%M:%S')}"
-        self.wfile.write(status_message.encode('utf-8'))
+        # The message only changes once a second, so it is formatted at most that often
+        now = int(time.time())
+        second, status_message = StatusHandler._status_cache
+        if second != now:
+            status_message = f"✅ Event Ticketing System is running.\nLast check: {time.strftime(TIMESTAMP_FORMAT, time.localtime(now))}".encode('utf-8')
+            StatusHandler._status_cache = (now, status_message)
+        self.send_body(status_message, "text/plain; charset=utf-8")
+
+    def send_cached_json_response(self, build_data):
+        """
+        Sends the JSON of build_data() with an ETag, honouring If-None-Match. The
+        body is cached per path and only rebuilt after MongoDB writes or once
+        RESPONSE_CACHE_TTL_SECONDS have passed.
+        """
+        version = mongo_client.data_version
+        cached = RESPONSE_CACHE.get(self.path)
+        if cached is None or cached[0] != version or time.monotonic() - cached[1] > RESPONSE_CACHE_TTL_SECONDS:
+            body = config.json_dumps(build_data())
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            cached = (version, time.monotonic(), etag, body)
+            RESPONSE_CACHE[self.path] = cached
+        _, _, etag, body = cached
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_body(body, "application/json; charset=utf-8", {"Cache-Control": "private, max-age=5", "ETag": etag})
 
     def send_attendees_response(self):
         """Fetches and returns all attendees from MongoDB."""
-        try:
+        def build_attendees():
             # CORRECTED: Use find_attendees_by_query with an empty dict to get all
-            attendees = mongo_client.find_attendees_by_query({})
+            attendees = mongo_client.find_attendees_by_query({}, attendee_projection())
             sanitized_attendees = []
             for attendee in attendees:
-                attendee['_id'] = str(attendee['_id']) # Convert ObjectId to string
                 sanitized_attendees.append({
                     "name": attendee.get(config.COL_NAME),
                     "email": attendee.get(config.COL_EMAIL),
@@ -106,35 +225,56 @@ class StatusHandler(http.server.SimpleHTTPRequestHandler):
                     "ticket_status": attendee.get(config.COL_TICKET_STATUS),
                     "email_status": attendee.get(config.COL_EMAIL_STATUS)
                 })
-            self.send_json_response(sanitized_attendees)
+            return sanitized_attendees
+        try:
+            self.send_cached_json_response(build_attendees)
         except Exception as e:
             self.send_error(500, f"Error fetching attendees: {e}")
             log_error(f"API Error fetching attendees: {e}")
 
     def send_unsent_response(self):
         """Fetches and returns attendees with unsent emails."""
-        try:
+        def build_unsent():
             unsent = mongo_client.find_attendees_by_query(
-                {config.COL_EMAIL_STATUS: {"$ne": "Sent"}}
+                {config.COL_EMAIL_STATUS: {"$ne": "Sent"}}, attendee_projection()
             )
             sanitized_unsent = []
             for attendee in unsent:
-                attendee['_id'] = str(attendee['_id'])
                 sanitized_unsent.append({
                     "name": attendee.get(config.COL_NAME),
                     "email": attendee.get(config.COL_EMAIL),
                     "attendee_id": attendee.get("attendee_id"),
                     "email_status": attendee.get(config.COL_EMAIL_STATUS)
                 })
-            self.send_json_response(sanitized_unsent)
+            return sanitized_unsent
+        try:
+            self.send_cached_json_response(build_unsent)
         except Exception as e:
             self.send_error(500, f"Error fetching unsent list: {e}")
             log_error(f"API Error fetching unsent list: {e}")
 
 
+class PooledHTTPServer(http.server.ThreadingHTTPServer):
+    """A ThreadingHTTPServer that handles requests on a fixed pool of WEB_WORKERS threads."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=WEB_WORKERS, thread_name_prefix="web")
+
+    def process_request(self, request, client_address):
+        # Queued on the pool instead of starting a new thread per request
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
 def run_web_server(port=8000):
     """Runs a simple HTTP server in a separate thread."""
-    with socketserver.TCPServer(("", port), StatusHandler) as httpd:
+    # Requests are served concurrently, so a slow MongoDB query cannot block other clients,
+    # while the bounded pool keeps a burst of clients from spawning unbounded threads
+    with PooledHTTPServer(("", port), StatusHandler) as httpd:
         print(f"🌐 Simple web server started at http://localhost:{port}")
         httpd.serve_forever()
 
@@ -142,6 +282,15 @@ def run_web_server(port=8000):
 # --- Utility Functions ---
 ###
 
+@functools.lru_cache(maxsize=1)
+def get_download_session() -> requests.Session:
+    """Returns the shared session for asset downloads, so they reuse keep-alive connections."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=3)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 def download_file(url, local_filename):
     """Downloads a file from a URL to a local path."""
     try:
@@ -151,11 +300,12 @@ def download_file(url, local_filename):
         else:
             download_url = url
 
-        with requests.get(download_url, stream=True) as r:
+        with get_download_session().get(download_url, stream=True, timeout=GOOGLE_HTTP_TIMEOUT) as r:
             r.raise_for_status()
+            # Copy the raw stream in 512 KiB blocks instead of a Python write per 8 KB chunk
+            r.raw.decode_content = True
             with open(local_filename, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+                shutil.copyfileobj(r.raw, f, length=DOWNLOAD_CHUNK_SIZE)
         print(f"✅ Successfully downloaded '{local_filename}' from URL.")
         return local_filename
     except Exception as e:
@@ -185,142 +335,308 @@ def get_folder_id_from_url(url: str) -> str:
         raise ValueError(f"Invalid Google Drive Folder URL: '{url}'. Could not extract Folder ID. {e}")
 
 
-def get_sheet_data(sheets_service, spreadsheet_id: str, data_range: str) -> tuple[list, list]:
-    """Fetches data from a Google Sheet, separating the header from data rows."""
+def sheets_request(sheets_session, method: str, url: str, **kwargs) -> dict:
+    """
+    Sends a raw Sheets API request, retrying 429/5xx responses and dropped
+    connections with jittered 2^n second backoff. Raises on the final failure.
+    """
+    for retry in range(GOOGLE_API_RETRIES + 1):
+        try:
+            response = sheets_session.request(method, url, timeout=GOOGLE_HTTP_TIMEOUT, **kwargs)
+            if response.status_code not in RETRYABLE_STATUS_CODES or retry == GOOGLE_API_RETRIES:
+                response.raise_for_status()
+                return response.json()
+        except requests.ConnectionError:
+            if retry == GOOGLE_API_RETRIES:
+                raise
+        time.sleep(random.random() * 2 ** retry)
+
+def get_sheet_modified_time(drive_service, spreadsheet_id: str) -> str | None:
+    """Returns the spreadsheet's Drive modifiedTime (a cheap metadata call), or None if it cannot be read."""
     try:
-        result = sheets_service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=data_range).execute()
-        values = result.get('values', [])
-        if not values:
-            return [], []
-        return values[0], values[1:] # headers, data
+        file = drive_service.files().get(
+            fileId=spreadsheet_id, fields='modifiedTime', supportsAllDrives=True
+        ).execute(num_retries=GOOGLE_API_RETRIES)
+        return file.get('modifiedTime')
     except HttpError as error:
+        log_error(f"❌ Error reading the sheet's modified time: {error}")
+        return None
+
+def get_sheet_data(sheets_session, spreadsheet_id: str, sheet_name: str, first_row: int = 0) -> tuple[list, list]:
+    """
+    Fetches the header row and the data rows from 'first_row' (0-based, below
+    the header) onwards in a single values.batchGet call.
+    """
+    ranges = [f"{sheet_name}!A1:Z1", f"{sheet_name}!A{first_row + 2}:Z"]
+    try:
+        # The fields mask drops the echoed range and dimension metadata from the response
+        result = sheets_request(
+            sheets_session, 'GET', f"{SHEETS_API_URL}/{spreadsheet_id}/values:batchGet",
+            params={'ranges': ranges, 'fields': 'valueRanges.values'}
+        )
+        header_range, data_range = result.get('valueRanges', [{}, {}])
+        headers = header_range.get('values', [[]])[0]
+        if not headers:
+            return [], []
+        return headers, data_range.get('values', []) # headers, data
+    except requests.RequestException as error:
         log_error(f"❌ An error occurred while fetching sheet data: {error}")
         return [], []
 
-def update_sheet_cell(sheets_service, spreadsheet_id: str, sheet_name: str, row_index: int, col_index: int, value: str) -> bool:
-    """Updates a single cell in the Google Sheet and returns True on success."""
-    range_name = f"{sheet_name}!{chr(ord('A') + col_index)}{row_index + 2}"
-    body = {'values': [[value]]}
-    try:
-        sheets_service.spreadsheets().values().update(spreadsheetId=spreadsheet_id, range=range_name, valueInputOption='RAW', body=body).execute()
-        print(f"✅ Sheet updated: Cell '{range_name}' set to '{value}'")
-        return True
-    except HttpError as error:
-        log_error(f"❌ Error updating cell {range_name}: {error}")
-        return False
+@functools.lru_cache(maxsize=256)
+def column_to_a1(col_index: int) -> str:
+    """Converts a 0-based column index to its A1 letters (0 -> 'A', 26 -> 'AA')."""
+    letters = ''
+    col_index += 1
+    while col_index:
+        col_index, remainder = divmod(col_index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+class PendingWrites:
+    """Buffers cell updates for one sheet so they can be sent in a single batchUpdate."""
+
+    def __init__(self, sheet_name: str):
+        self.sheet_name = sheet_name
+        self.cells = {} # (row_index, col_index) -> value; the latest value per cell wins
+
+    def append(self, row_index: int, col_index: int, value: str):
+        self.cells[(row_index, col_index)] = value
+
+    def flush(self, sheets_session, spreadsheet_id: str) -> bool:
+        """Writes all buffered cells with one values.batchUpdate call and returns True on success."""
+        if not self.cells:
+            return True
+        data = [
+            {'range': f"{self.sheet_name}!{column_to_a1(col_index)}{row_index + 2}", 'values': [[value]]}
+            for (row_index, col_index), value in self.cells.items()
+        ]
+        self.cells = {}
+        try:
+            sheets_request(
+                sheets_session, 'POST', f"{SHEETS_API_URL}/{spreadsheet_id}/values:batchUpdate",
+                json={'valueInputOption': 'RAW', 'data': data}
+            )
+            print(f"✅ Sheet updated: {len(data)} cell(s) written in one batch")
+            return True
+        except requests.RequestException as error:
+            log_error(f"❌ Error updating cells {', '.join(d['range'] for d in data)}: {error}")
+            return False
+
+def update_sheet_cell(pending_writes: PendingWrites, row_index: int, col_index: int, value: str):
+    """Queues a single cell update; it is sent on the next pending_writes.flush()."""
+    pending_writes.append(row_index, col_index, value)
+
+def encode_png(img: Image.Image) -> bytes:
+    """Serializes an image to PNG bytes in memory."""
+    buffer = io.BytesIO()
+    # Tickets are mostly flat colour, so fast zlib compression costs little in size
+    img.save(buffer, 'PNG', compress_level=PNG_COMPRESS_LEVEL, optimize=False)
+    return buffer.getvalue()
 
-def upload_file_to_drive(drive_service, file_path: str, folder_id: str, file_name: str) -> str | None:
-    """Uploads a file to a specified Google Drive folder."""
+def upload_file_to_drive(drive_service, png_bytes: bytes, folder_id: str, file_name: str) -> str | None:
+    """Uploads an in-memory PNG to a specified Google Drive folder."""
     file_metadata = {'name': file_name, 'parents': [folder_id]}
-    media = MediaFileUpload(file_path, mimetype='image/png')
+    media = MediaIoBaseUpload(io.BytesIO(png_bytes), mimetype='image/png', resumable=False)
     try:
         file = drive_service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id',
             supportsAllDrives=True
-        ).execute()
+        ).execute(num_retries=GOOGLE_API_RETRIES)
         print(f"✅ Uploaded '{file_name}' to Drive. File ID: {file.get('id')}")
         return file.get('id')
     except HttpError as error:
         log_error(f"❌ Error uploading '{file_name}' to Drive: {error}")
         return None
 
-def generate_qr_code(data: str, file_path: str, size: int, corner_radius: int) -> bool:
-    """Generates and saves a QR code image with rounded corners."""
+@functools.lru_cache(maxsize=8)
+def rounded_corner_mask(size: int, corner_radius: int) -> Image.Image:
+    """Builds the rounded-corner alpha mask for a QR code once per size; callers must not modify it."""
+    mask = Image.new('L', (size, size), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.rounded_rectangle((0, 0, size, size), radius=corner_radius, fill=255)
+    return mask
+
+def generate_qr_code(data: str, size: int, corner_radius: int) -> Image.Image | None:
+    """Generates a QR code image with rounded corners."""
+    # Imported on first use; the web server and startup never need the QR encoder
+    import qrcode
+    from qrcode.exceptions import DataOverflowError
     try:
-        qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=2)
-        qr.add_data(data)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white").convert("RGBA").resize((size, size), Image.Resampling.LANCZOS)
-
-        mask = Image.new('L', (size, size), 0)
-        draw = ImageDraw.Draw(mask)
-        draw.rounded_rectangle((0, 0, size, size), radius=corner_radius, fill=255)
-
-        img.putalpha(mask)
-        
-        img.save(file_path)
-        print(f"✅ QR code with rounded corners generated: {file_path}")
-        return True
+        # Attendee IDs are 36-character UUIDs, so the version and mask can be pinned instead
+        # of searched for on every call; anything longer falls back to the best fit
+        qr = qrcode.QRCode(version=QR_VERSION, error_correction=qrcode.constants.ERROR_CORRECT_L, border=2, mask_pattern=QR_MASK_PATTERN)
+        qr.add_data(data, optimize=0)
+        try:
+            qr.make(fit=False)
+        except DataOverflowError:
+            qr.make(fit=True)
+        # Build a 1px-per-module bitmap straight from the matrix and scale it up with
+        # NEAREST: QR modules are binary, so there is nothing for LANCZOS to smooth
+        matrix = qr.get_matrix()
+        modules = bytes(0 if cell else 255 for matrix_row in matrix for cell in matrix_row)
+        img = Image.frombytes('L', (len(matrix), len(matrix)), modules).resize((size, size), Image.Resampling.NEAREST)
+
+        img.putalpha(rounded_corner_mask(size, corner_radius)) # 'L' + alpha -> 'LA', 2 bytes per pixel instead of RGBA's 4
+        print(f"✅ QR code with rounded corners generated for {data}")
+        return img
     except Exception as e:
         log_error(f"❌ Error generating QR code: {e}")
+        return None
+
+def load_assets() -> bool:
+    """Downloads and decodes the email template, ticket template and font once, before any tickets are made."""
+    global _EMAIL_TEMPLATE, _TEMPLATE, _FONT
+    local_email_path = download_file(config.EMAIL_MESSAGE_PATH, "temp/email_message.html")
+    if local_email_path:
+        with open(local_email_path, 'r', encoding='utf-8') as f:
+            _EMAIL_TEMPLATE = f.read()
+    else:
+        log_error("Critical error: Email template download failed. Emails cannot be sent.")
+
+    local_template_path = download_file(config.TICKET_TEMPLATE_EMPTY_PATH, "temp/template.png")
+    if not local_template_path:
+        log_error("Critical error: Template download failed. Tickets cannot be created.")
         return False
+    template = Image.open(local_template_path)
+    # Only keep an alpha channel if the template actually has transparency
+    has_alpha = template.mode in ('RGBA', 'LA', 'PA') or 'transparency' in template.info
+    _TEMPLATE = template.convert('RGBA' if has_alpha else 'RGB')
+    _TEMPLATE.load()
 
-def create_ticket_image(output_path: str, name: str, qr_code_path: str) -> bool:
+    try:
+        # Use font size from config; a remote font file is downloaded once and cached locally
+        _FONT = ImageFont.truetype(config.localize_remote_file(config.FONT_PATH, ".ttf"), config.DETECTED_FONT_SIZE)
+    except IOError:
+        print(f"⚠️ Warning: Font '{config.FONT_PATH}' could not be loaded. Using default font.")
+        _FONT = ImageFont.load_default()
+    text_width.cache_clear()
+    return _EMAIL_TEMPLATE is not None
+
+@functools.lru_cache(maxsize=1024)
+def text_width(name: str) -> float:
+    """Width of a name rendered in the ticket font, cached per unique name."""
+    text_bbox = _FONT.getbbox(name)
+    return text_bbox[2] - text_bbox[0]
+
+def create_ticket_image(name: str, qr_img: Image.Image) -> Image.Image | None:
     """Creates a personalized ticket by overlaying a name and QR code onto a template."""
     try:
-        # --- Download assets using paths from config.py ---
-        local_template_path = download_file(config.TICKET_TEMPLATE_EMPTY_PATH, "temp/template.png")
-        local_font_path = download_file(config.FONT_PATH, "temp/Inter-Bold.ttf")
-        
-        if not local_template_path or not local_font_path:
-            log_error("Critical error: Font or template download failed. Cannot create ticket.")
-            return False
+        if _TEMPLATE is None:
+            log_error("Critical error: Ticket template is not loaded. Cannot create ticket.")
+            return None
 
-        base_img = Image.open(local_template_path).convert("RGBA")
+        base_img = _TEMPLATE.copy()
         draw = ImageDraw.Draw(base_img)
 
-        try:
-            # Use font size from config
-            font = ImageFont.truetype(local_font_path, config.DETECTED_FONT_SIZE)
-        except IOError:
-            print(f"⚠️ Warning: Font from URL '{config.FONT_PATH}' could not be loaded. Using default font.")
-            font = ImageFont.load_default()
-
         # --- Position and draw the name with the new style ---
-        text_bbox = draw.textbbox((0, 0), name, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        
         # Center the text horizontally
-        text_x = (base_img.width - text_width) / 2
+        text_x = (base_img.width - text_width(name)) / 2
         # Use Y position from config
         text_y = config.DETECTED_NAME_TEXT_Y_POS
-        draw.text((text_x, text_y), name, font=font, fill=config.TEXT_COLOR)
+        draw.text((text_x, text_y), name, font=_FONT, fill=config.TEXT_COLOR)
 
         # --- Position and paste the QR code ---
-        qr_img = Image.open(qr_code_path).convert("RGBA")
-        
         # Center the QR code horizontally
         qr_x = (base_img.width - qr_img.width) / 2
         # Use Y position from config
         qr_y = config.DETECTED_QR_CODE_Y_POS
         
-        base_img.paste(qr_img, (int(qr_x), int(qr_y)), qr_img)
+        base_img.paste(qr_img, (int(qr_x), int(qr_y)), qr_img) # The 'LA' alpha masks the rounded corners
 
-        base_img.save(output_path)
-        print(f"✅ Personalized ticket created: {output_path}")
-        return True
+        print(f"✅ Personalized ticket created for {name}")
+        return base_img
     except Exception as e:
         log_error(f"❌ Error creating ticket image: {e}")
-        return False
+        return None
+
+class SMTPConnection:
+    """
+    A logged-in SMTP_SSL connection reused for every email in a polling cycle.
+    It connects on the first send and reconnects once if the server has dropped it.
+    """
+
+    def __init__(self, host: str = 'smtp.gmail.com', port: int = 465, timeout: int = 30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout # Socket timeout so a stalled server cannot hang a worker
+        self.smtp = None
+        self.last_used = 0.0
+        self.lock = threading.Lock() # smtplib connections are not thread-safe
+
+    def connect(self):
+        self.close()
+        self.smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        self.smtp.login(config.SENDER_EMAIL, config.SENDER_APP_PASSWORD)
+        self.last_used = time.monotonic()
+        print("✅ Connected to the SMTP server.")
+
+    def close(self):
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.smtp = None
+
+    def is_alive(self) -> bool:
+        """Probes a connection that has been idle for a while with NOOP."""
+        if time.monotonic() - self.last_used < SMTP_IDLE_CHECK_SECONDS:
+            return True
+        try:
+            return self.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
 
-def send_ticket_email(recipient_email: str, recipient_name: str, ticket_file_path: str) -> bool:
+    def send(self, msg):
+        with self.lock:
+            if self.smtp is None or not self.is_alive():
+                self.connect()
+            try:
+                self.smtp.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError):
+                print("⚠️ SMTP connection lost. Reconnecting...")
+                self.connect()
+                self.smtp.send_message(msg)
+            self.last_used = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self.lock:
+            self.close()
+
+def build_ticket_message(recipient_email: str, recipient_name: str, ticket_b64: str, ticket_filename: str) -> MIMEMultipart:
+    """Builds the ticket email from the cached HTML template and the already base64-encoded ticket."""
+    # str.replace rather than str.format: the HTML may contain CSS braces
+    email_body = _EMAIL_TEMPLATE.replace('{name}', recipient_name)
+    msg = MIMEMultipart()
+    msg['From'] = config.SENDER_EMAIL
+    msg['To'] = recipient_email
+    msg['Subject'] = "Your Event E-Ticket is Here!"
+    # CORRECTED: Send email as HTML
+    msg.attach(MIMEText(email_body, 'html'))
+
+    # The payload is encoded once per ticket, so retries do not base64 the PNG again
+    img = MIMEBase('image', 'png')
+    img.set_payload(ticket_b64)
+    img['Content-Transfer-Encoding'] = 'base64'
+    img.add_header('Content-Disposition', 'attachment', filename=ticket_filename)
+    msg.attach(img)
+    return msg
+
+def send_ticket_email(smtp: SMTPConnection, recipient_email: str, recipient_name: str, ticket_b64: str, ticket_filename: str) -> bool:
     """Sends an email with the generated ticket attached."""
     try:
-        local_email_path = download_file(config.EMAIL_MESSAGE_PATH, "temp/email_message.html")
-        if not local_email_path:
+        if _EMAIL_TEMPLATE is None:
+            log_error(f"❌ Email template is not loaded. Cannot email {recipient_email}.")
             return False
 
-        with open(local_email_path, 'r', encoding='utf-8') as f:
-            message_template = f.read()
-
-        email_body = message_template.replace('{name}', recipient_name)
-        msg = MIMEMultipart()
-        msg['From'] = config.SENDER_EMAIL
-        msg['To'] = recipient_email
-        msg['Subject'] = "Your Event E-Ticket is Here!"
-        # CORRECTED: Send email as HTML
-        msg.attach(MIMEText(email_body, 'html'))
-
-        with open(ticket_file_path, 'rb') as fp:
-            img = MIMEImage(fp.read(), _subtype="png")
-            img.add_header('Content-Disposition', 'attachment', filename=os.path.basename(ticket_file_path))
-            msg.attach(img)
-
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-            smtp.login(config.SENDER_EMAIL, config.SENDER_APP_PASSWORD)
-            smtp.send_message(msg)
+        smtp.send(build_ticket_message(recipient_email, recipient_name, ticket_b64, ticket_filename))
         print(f"✅ Email with ticket successfully sent to {recipient_email}.")
         return True
     except Exception as e:
@@ -331,36 +647,283 @@ def get_value_safe(row: list, col_idx: int) -> str:
     """Safely retrieves a value from a list (sheet row)."""
     return row[col_idx] if col_idx < len(row) else ''
 
+###
+# --- Google API Clients ---
+###
+
+# googleapiclient services and requests sessions are not thread-safe, so every worker thread builds its own
+_thread_state = threading.local()
+
+@functools.lru_cache(maxsize=1)
+def get_google_credentials():
+    """Parses the service account once; the credentials and their access token are shared by all threads."""
+    cred_dict = json.loads(config.GOOGLE_SA_JSON)
+    scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+    return Credentials.from_service_account_info(cred_dict, scopes=scopes)
+
+def build_google_service(service_name, version):
+    """Builds a Google service client using the service account from config."""
+    if not config.GOOGLE_SA_JSON:
+        log_error(f"⚠️ {service_name.capitalize()} service not configured. Check GOOGLE_SERVICE_ACCOUNT_JSON in .env")
+        return None
+    # Imported on first use; the discovery machinery is only needed for the Drive client
+    from googleapiclient.discovery import build
+    try:
+        # Each service keeps its own keep-alive connection, so repeated calls skip the TLS handshake
+        http = AuthorizedHttp(get_google_credentials(), http=httplib2.Http(timeout=GOOGLE_HTTP_TIMEOUT))
+        service = build(service_name, version, http=http, cache_discovery=False)
+        print(f"✅ Google {service_name.capitalize()} service initialized.")
+        return service
+    except Exception as e:
+        log_error(f"❌ Error initializing {service_name.capitalize()} service: {e}")
+        return None
+
+def build_sheets_session():
+    """
+    Builds an authorized requests session for the Sheets endpoints. The two calls
+    made per row (values.batchGet and values.batchUpdate) are posted directly,
+    skipping googleapiclient's discovery-based request building.
+    """
+    if not config.GOOGLE_SA_JSON:
+        log_error("⚠️ Sheets service not configured. Check GOOGLE_SERVICE_ACCOUNT_JSON in .env")
+        return None
+    try:
+        session = AuthorizedSession(get_google_credentials())
+        print("✅ Google Sheets session initialized.")
+        return session
+    except Exception as e:
+        log_error(f"❌ Error initializing Sheets session: {e}")
+        return None
+
+def get_google_services():
+    """Returns the (sheets session, drive service) pair for the calling thread, building them on first use."""
+    if not getattr(_thread_state, 'services', None) or not all(_thread_state.services):
+        _thread_state.services = (build_sheets_session(), build_google_service('drive', 'v3'))
+    return _thread_state.services
+
+def call_with_retries(func, *args):
+    """Calls func until it returns a truthy result, waiting 2^attempt seconds between tries."""
+    result = None
+    for attempt in range(MAX_ATTEMPTS):
+        result = func(*args)
+        if result:
+            return result
+        if attempt < MAX_ATTEMPTS - 1:
+            print(f"🔁 Retrying {func.__name__} in {2 ** attempt}s (attempt {attempt + 2}/{MAX_ATTEMPTS})...")
+            time.sleep(2 ** attempt)
+    return result
+
+def upload_to_drive_in_thread(png_bytes: bytes, folder_id: str, file_name: str) -> str | None:
+    """Uploads a PNG from an I/O pool thread using that thread's Drive service."""
+    _, drive_service = get_google_services()
+    return upload_file_to_drive(drive_service, png_bytes, folder_id, file_name)
+
 ###
 # --- Main Execution Logic ---
 ###
+def load_known_attendees(sheet_data: list) -> tuple[dict, dict]:
+    """
+    Fetches the stored attendees for every unsent row in one MongoDB query and
+    returns them indexed by attendee ID and by (email, name).
+    """
+    attendee_ids, emails = set(), set()
+    for row in sheet_data:
+        if get_value_safe(row, COLUMN_INDICES[config.COL_TICKET_STATUS]).strip() == "Sent":
+            continue
+        attendee_id = get_value_safe(row, COLUMN_INDICES["Attendee ID"]).strip()
+        if attendee_id:
+            attendee_ids.add(attendee_id)
+        email = get_value_safe(row, COLUMN_INDICES[config.COL_EMAIL]).strip()
+        if email:
+            emails.add(email)
+    if not attendee_ids and not emails:
+        return {}, {}
+
+    by_id, by_email_and_name = {}, {}
+    for attendee in mongo_client.find_attendees_for_rows(attendee_ids, emails):
+        by_id[attendee.get("attendee_id")] = attendee
+        by_email_and_name[(attendee.get(config.COL_EMAIL), attendee.get(config.COL_NAME))] = attendee
+    return by_id, by_email_and_name
+
+def process_row(smtp: SMTPConnection, i: int, row: list, row_unique_id: str, headers: list, spreadsheet_id: str, tickets_folder_id: str, qr_codes_folder_id: str, known_attendees: tuple[dict, dict]) -> bool:
+    """
+    Generates, uploads and emails the ticket for one sheet row, which the caller
+    has already claimed as 'row_unique_id'. Runs on a row pool thread.
+    'known_attendees' is the result of load_known_attendees for this cycle.
+    """
+    name = get_value_safe(row, COLUMN_INDICES[config.COL_NAME]).strip()
+    email = get_value_safe(row, COLUMN_INDICES[config.COL_EMAIL]).strip()
+
+    print(f"\n✨ Processing new entry: Name='{name}', Email='{email}'")
+    pending_writes = PendingWrites(config.MAIN_SHEET_NAME)
+    claimed_ids = {row_unique_id}
+    row_done = False # Whether the row needs no more work; decides the final claim state
+    sheets_session = None
+    try:
+        sheets_session, _ = get_google_services()
+        update_sheet_cell(pending_writes, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Generating...")
+
+        attendee_id = None
+        # The attendee_id match is tried first; email+name is the fallback for rows without an ID
+        sheet_attendee_id = get_value_safe(row, COLUMN_INDICES["Attendee ID"]).strip()
+        attendees_by_id, attendees_by_email_and_name = known_attendees
+        existing_attendee = attendees_by_id.get(sheet_attendee_id) if sheet_attendee_id else None
+        if not existing_attendee:
+            existing_attendee = attendees_by_email_and_name.get((email, name))
+        # A retried row whose email already went out (e.g. only its Drive upload failed) is not emailed again
+        already_emailed = bool(existing_attendee) and existing_attendee.get(config.COL_TICKET_STATUS) == "Sent"
+
+        if existing_attendee:
+            print(f"↪️ Found existing attendee in DB for email: {email} and name: {name}")
+            attendee_id = existing_attendee.get("attendee_id")
+            if sheet_attendee_id != attendee_id:
+                print(f"⚠️ Sheet has incorrect ID. Updating sheet with correct ID: {attendee_id}")
+                update_sheet_cell(pending_writes, i, COLUMN_INDICES["Attendee ID"], attendee_id)
+        else:
+            print(f"➕ No existing attendee found for {email} and {name}. Creating new entry.")
+            attendee_id = str(uuid.uuid4())
+            update_sheet_cell(pending_writes, i, COLUMN_INDICES["Attendee ID"], attendee_id)
+            # The ID must be on the sheet before the attendee is stored, so flush now
+            id_update_success = pending_writes.flush(sheets_session, spreadsheet_id)
+            if id_update_success:
+                try:
+                    # Rows omit trailing blank cells, so they are padded to the header width;
+                    # untitled columns carry no form field and are left out
+                    padded_row = row + [''] * (len(headers) - len(row))
+                    full_attendee_data = {header: value for header, value in zip(headers, padded_row) if header}
+                    full_attendee_data['attendee_id'] = attendee_id
+                    full_attendee_data[config.COL_TICKET_STATUS] = 'Issued'
+                    full_attendee_data[config.COL_EMAIL_STATUS] = 'Pending'
+                    mongo_client.insert_full_attendee(full_attendee_data)
+                    print(f"✅ New attendee '{name}' inserted into MongoDB with ID: {attendee_id}")
+                except Exception as e:
+                    log_error(f"❌ Error inserting new attendee '{name}' into MongoDB: {e}")
+                    update_sheet_cell(pending_writes, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Failed (DB)")
+                    return False
+            else:
+                log_error(f"❌ Aborting processing for '{name}' due to sheet update failure.")
+                update_sheet_cell(pending_writes, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Failed (Sheet)")
+                return False
+
+        # Once the row carries its ID it is looked up by that key, so claim it too. If that
+        # claim is already held, another row (e.g. a resubmission) resolved to the same attendee
+        if attendee_id != row_unique_id:
+            attendee_claim = mongo_client.claim_row(attendee_id)
+            # An earlier failed attempt for this attendee is retried by this row
+            if attendee_claim == "failed" and mongo_client.reclaim_failed_row(attendee_id):
+                attendee_claim = None
+            if attendee_claim is not None:
+                print(f"↪️ Skipping '{name}': attendee {attendee_id} is already claimed by another row ({attendee_claim}).")
+                update_sheet_cell(pending_writes, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Duplicate")
+                # A duplicate of an attendee whose ticket was sent needs no more work
+                row_done = attendee_claim == "sent"
+                return row_done
+            claimed_ids.add(attendee_id)
+
+        # Use QR code size from config and set a corner radius
+        qr_img = generate_qr_code(attendee_id, config.DETECTED_QR_CODE_TARGET_SIZE, 30)
+        if qr_img is None:
+            update_sheet_cell(pending_writes, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Failed (QR)")
+            return False
+
+        ticket_img = create_ticket_image(name, qr_img)
+        if ticket_img is None:
+            update_sheet_cell(pending_writes, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Failed (Image)")
+            return False
+
+        # The images stay in memory; each is encoded to PNG once for Drive and the email
+        safe_name = name.replace(' ', '_')
+        qr_filename = f"{safe_name}_QR.png"
+        ticket_filename = f"{safe_name}_Ticket.png"
+        qr_png = encode_png(qr_img)
+        ticket_png = encode_png(ticket_img)
+        # Free the decoded rasters (several MB for the ticket) before the slow network stages
+        del qr_img, ticket_img
+
+        # Both uploads run on the I/O pool while this thread moves on to the email
+        f_qr = IO_POOL.submit(upload_to_drive_in_thread, qr_png, qr_codes_folder_id, qr_filename)
+        f_ticket = IO_POOL.submit(upload_to_drive_in_thread, ticket_png, tickets_folder_id, ticket_filename)
+
+        # Only each column's final value reaches the sheet; "Generated" stays if the email fails.
+        # The email status is always set below, so no "Sending..." placeholder is queued for it.
+        if already_emailed:
+            print(f"↪️ Ticket for '{name}' was already emailed; only uploading it to Drive again.")
+            email_sent = True
+        else:
+            update_sheet_cell(pending_writes, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Generated")
+            mongo_client.update_attendee_fields(attendee_id, {config.COL_TICKET_STATUS: "Generated", config.COL_EMAIL_STATUS: "Sending..."})
+
+            ticket_b64 = base64.encodebytes(ticket_png).decode('ascii') # 76-char lines, as MIME expects
+            email_sent = call_with_retries(send_ticket_email, smtp, email, name, ticket_b64, ticket_filename)
+        if email_sent:
+            # Recorded in MongoDB first, so a crash before the sheet flush cannot cause a resend
+            mongo_client.mark_processed(attendee_id)
+            update_sheet_cell(pending_writes, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Sent")
+            update_sheet_cell(pending_writes, i, COLUMN_INDICES[config.COL_EMAIL_STATUS], "Sent")
+        else:
+            update_sheet_cell(pending_writes, i, COLUMN_INDICES[config.COL_EMAIL_STATUS], "Failed (Email)")
+            mongo_client.update_attendee_field(attendee_id, config.COL_EMAIL_STATUS, "Failed (Email)")
+
+        # The row only counts as finished once its files are on Drive
+        uploads_ok = True
+        for future, file_name in ((f_qr, qr_filename), (f_ticket, ticket_filename)):
+            try:
+                file_id = future.result()
+            except Exception as e:
+                log_error(f"❌ Error uploading '{file_name}' to Drive: {e}")
+                file_id = None
+            uploads_ok = uploads_ok and bool(file_id)
+        if not uploads_ok:
+            log_error(f"❌ Ticket files for '{name}' ({attendee_id}) did not reach Drive.")
+            update_sheet_cell(pending_writes, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Failed (Drive)")
+
+        row_done = email_sent and uploads_ok
+        return row_done
+    finally:
+        # All status changes for this row go out in one batchUpdate
+        if sheets_session:
+            pending_writes.flush(sheets_session, spreadsheet_id)
+        mongo_client.set_claim_state(claimed_ids, "sent" if row_done else "failed")
+
+def connect_mongo():
+    """Connects to MongoDB, creates the indexes and resets the row claims before polling starts."""
+    global mongo_client
+    mongo_client = MongoDBClient()
+    mongo_client.ensure_indexes()
+
+    # Rows are claimed in MongoDB, so attendees whose tickets were sent stay skipped across
+    # restarts; failed or interrupted rows are released here to be retried once
+    released = mongo_client.release_unfinished_claims()
+    seeded = mongo_client.seed_sent_claims()
+    print(f"↪️ Row claims ready: {released} unfinished claim(s) released, {seeded} sent attendee(s) added.")
+
 def main():
     """Main function to run the ticketing automation loop."""
+    global IO_POOL
     print("--- 🚀 Event Ticketing Automation System ---")
 
     importlib.reload(config)
+    # temp/ only holds the downloaded template and email assets; tickets never touch disk
+    os.makedirs("temp", exist_ok=True)
+
+    # The asset downloads and the MongoDB connection run alongside the Google client setup,
+    # so startup takes as long as the slowest of them rather than their sum. The Google
+    # clients are per-thread, so they are built here on the main thread.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup") as startup_pool:
+        assets_future = startup_pool.submit(load_assets)
+        mongo_future = startup_pool.submit(connect_mongo)
+
+        print("\n--- Initializing Google API services ---")
+        sheets_session, drive_service = get_google_services()
+        assets_loaded = assets_future.result()
+        mongo_future.result()
+
+    # The template and email HTML are only loaded here, so without them every row would fail
+    if not assets_loaded:
+        log_error("❌ CRITICAL: Could not load the ticket template or email message. Check the asset paths in your .env file.")
+        exit(1)
 
-    def build_google_service(service_name, version):
-        """Builds a Google service client using the service account from config."""
-        if not config.GOOGLE_SA_JSON:
-            log_error(f"⚠️ {service_name.capitalize()} service not configured. Check GOOGLE_SERVICE_ACCOUNT_JSON in .env")
-            return None
-        try:
-            cred_dict = json.loads(config.GOOGLE_SA_JSON)
-            scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-            creds = Credentials.from_service_account_info(cred_dict, scopes=scopes)
-            service = build(service_name, version, credentials=creds)
-            print(f"✅ Google {service_name.capitalize()} service initialized.")
-            return service
-        except Exception as e:
-            log_error(f"❌ Error initializing {service_name.capitalize()} service: {e}")
-            return None
-
-    print("\n--- Initializing Google API services ---")
-    sheets_service = build_google_service('sheets', 'v4')
-    drive_service = build_google_service('drive', 'v3')
-
-    if not sheets_service or not drive_service:
+    if not sheets_session or not drive_service:
         log_error("❌ CRITICAL: Could not authenticate with Google APIs. Check your service account credentials.")
         exit(1)
 
@@ -372,112 +935,149 @@ def main():
         log_error(f"❌ CRITICAL: {e}. Check your links in the .env file.")
         exit(1)
 
-    print(f"\n--- 🔄 Starting continuous monitoring of '{config.MAIN_SHEET_NAME}' ---")
-    print(f"Polling every {config.POLLING_INTERVAL_SECONDS} seconds. Press Ctrl+C to stop.")
+    # Rows are processed concurrently; each row hands its Drive uploads to a separate I/O pool
+    row_pool = concurrent.futures.ThreadPoolExecutor(max_workers=ROW_WORKERS, thread_name_prefix="row")
+    IO_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+    pending = {} # future -> row_unique_id, bounded by MAX_PENDING_ROWS
+
+    # Only rows below the high-water mark are fetched; it survives restarts in MongoDB
+    last_row = mongo_client.get_cursor(config.MAIN_SHEET_NAME)
+    headers_signature = None
+    next_reconcile = 0.0 # A full scan runs at startup and then every RECONCILE_INTERVAL_SECONDS
+    # Drive modifiedTime of the last fetch that left no rows to retry; while it is
+    # unchanged the sheet is not fetched, and idle polls back off exponentially
+    seen_modified_time = None
+    idle_polls = 0
+
+    print(f"\n--- 🔄 Starting continuous monitoring of '{config.MAIN_SHEET_NAME}' from data row {last_row + 1} ---")
+    print(f"Polling every {config.POLLING_INTERVAL_SECONDS} seconds (backing off to {MAX_IDLE_POLL_SECONDS}s when idle). Press Ctrl+C to stop.")
 
     while True:
         try:
-            print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] Checking for new data...")
-            headers, sheet_data = get_sheet_data(sheets_service, spreadsheet_id, config.DATA_RANGE_INITIAL)
+            print(f"\n[{time.strftime(TIMESTAMP_FORMAT)}] Checking for new data...")
+            # Now and then the whole sheet is read, so rows the cursor has moved past
+            # (e.g. after rows were deleted or re-sorted) are still picked up
+            first_row = last_row
+            modified_time = get_sheet_modified_time(drive_service, spreadsheet_id)
+            reconciling = time.monotonic() >= next_reconcile
+            if reconciling:
+                print("🔍 Running a full reconciliation scan of the sheet...")
+                first_row = 0
+                next_reconcile = time.monotonic() + RECONCILE_INTERVAL_SECONDS
+            elif modified_time and modified_time == seen_modified_time:
+                print("Sheet unchanged since the last check. Waiting for new entries...")
+                idle_polls = 0 if wait_for_next_poll(idle_polls) else idle_polls + 1
+                continue
+            headers, sheet_data = get_sheet_data(sheets_session, spreadsheet_id, config.MAIN_SHEET_NAME, first_row)
 
             if not headers:
-                time.sleep(config.POLLING_INTERVAL_SECONDS)
+                seen_modified_time = None
+                idle_polls = 0 if wait_for_next_poll(idle_polls) else idle_polls + 1
                 continue
 
-            required_columns = [config.COL_NAME, config.COL_EMAIL, config.COL_TICKET_STATUS, config.COL_EMAIL_STATUS, "Attendee ID"]
-            for col_name in required_columns:
-                if col_name not in headers:
-                    log_error(f"❌ CRITICAL: Column '{col_name}' not found in sheet. Exiting.")
+            # Column positions are only rebuilt and re-validated when the header row changes
+            if tuple(headers) != headers_signature:
+                column_indices = {}
+                for idx, header in enumerate(headers):
+                    column_indices.setdefault(header, idx) # The first matching column wins
+                required_columns = [config.COL_NAME, config.COL_EMAIL, config.COL_TICKET_STATUS, config.COL_EMAIL_STATUS, "Attendee ID"]
+                missing = [col_name for col_name in required_columns if col_name not in column_indices]
+                if missing:
+                    log_error(f"❌ CRITICAL: Column(s) {', '.join(repr(c) for c in missing)} not found in sheet. Exiting.")
                     exit(1)
-                COLUMN_INDICES[col_name] = headers.index(col_name)
+                COLUMN_INDICES.clear()
+                COLUMN_INDICES.update(column_indices)
+                headers_signature = tuple(headers)
 
             if not sheet_data:
-                print("No data rows found. Waiting for new entries...")
-                time.sleep(config.POLLING_INTERVAL_SECONDS)
+                print("No new rows found. Waiting for new entries...")
+                seen_modified_time = modified_time
+                idle_polls = 0 if wait_for_next_poll(idle_polls) else idle_polls + 1
                 continue
 
-            for i, row in enumerate(sheet_data):
-                name = get_value_safe(row, COLUMN_INDICES[config.COL_NAME]).strip()
-                email = get_value_safe(row, COLUMN_INDICES[config.COL_EMAIL]).strip()
-                ticket_status = get_value_safe(row, COLUMN_INDICES[config.COL_TICKET_STATUS]).strip()
-
-                if not name or not email: continue
-                row_unique_id = f"{name}-{email}"
-                if ticket_status == "Sent" or row_unique_id in PROCESSED_ENTRIES: continue
-
-                print(f"\n✨ Processing new entry: Name='{name}', Email='{email}'")
-                PROCESSED_ENTRIES.add(row_unique_id)
-                os.makedirs("temp", exist_ok=True)
-
-                update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Generating...")
-
-                attendee_id = None
-                existing_attendee = mongo_client.find_attendee_by_email_and_name(email, name)
-
-                if existing_attendee:
-                    print(f"↪️ Found existing attendee in DB for email: {email} and name: {name}")
-                    attendee_id = existing_attendee.get("attendee_id")
-                    sheet_attendee_id = get_value_safe(row, COLUMN_INDICES["Attendee ID"]).strip()
-                    if sheet_attendee_id != attendee_id:
-                        print(f"⚠️ Sheet has incorrect ID. Updating sheet with correct ID: {attendee_id}")
-                        update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES["Attendee ID"], attendee_id)
-                else:
-                    print(f"➕ No existing attendee found for {email} and {name}. Creating new entry.")
-                    attendee_id = str(uuid.uuid4())
-                    id_update_success = update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES["Attendee ID"], attendee_id)
-                    if id_update_success:
-                        try:
-                            full_attendee_data = {header: get_value_safe(row, idx) for idx, header in enumerate(headers)}
-                            full_attendee_data['attendee_id'] = attendee_id
-                            full_attendee_data[config.COL_TICKET_STATUS] = 'Issued'
-                            full_attendee_data[config.COL_EMAIL_STATUS] = 'Pending'
-                            mongo_client.insert_full_attendee(full_attendee_data)
-                            print(f"✅ New attendee '{name}' inserted into MongoDB with ID: {attendee_id}")
-                        except Exception as e:
-                            log_error(f"❌ Error inserting new attendee '{name}' into MongoDB: {e}")
-                            update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Failed (DB)")
-                            continue
-                    else:
-                        log_error(f"❌ Aborting processing for '{name}' due to sheet update failure.")
-                        update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Failed (Sheet)")
-                        continue
-
-                qr_filename = f"{name.replace(' ', '_')}_QR.png"
-                qr_path = os.path.join("temp", qr_filename)
-                
-                # Use QR code size from config and set a corner radius
-                if not generate_qr_code(attendee_id, qr_path, config.DETECTED_QR_CODE_TARGET_SIZE, 30):
-                    update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Failed (QR)")
+            # Per fetched row: True once it needs no more work, False if it must be fetched
+            # again next cycle, or the future of its process_row call
+            row_results = []
+            # One query looks up the stored attendees for every row of this cycle
+            known_attendees = load_known_attendees(sheet_data)
+            # The column positions are bound once, not looked up per row
+            name_idx = COLUMN_INDICES[config.COL_NAME]
+            email_idx = COLUMN_INDICES[config.COL_EMAIL]
+            ticket_status_idx = COLUMN_INDICES[config.COL_TICKET_STATUS]
+            attendee_id_idx = COLUMN_INDICES["Attendee ID"]
+            # First pass: the row ID of each row to process, or None for rows needing no work
+            row_ids = []
+            for offset, row in enumerate(sheet_data):
+                # Sent rows make up most of a full scan, so they are skipped before anything else is parsed
+                if get_value_safe(row, ticket_status_idx).strip() == "Sent":
+                    row_ids.append(None)
                     continue
-
-                ticket_filename = f"{name.replace(' ', '_')}_Ticket.png"
-                ticket_path = os.path.join("temp", ticket_filename)
-                if not create_ticket_image(ticket_path, name, qr_path):
-                    update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Failed (Image)")
+                name = get_value_safe(row, name_idx).strip()
+                email = get_value_safe(row, email_idx).strip()
+                if not name or not email:
+                    # Such a row can never be processed, so it must not hold the cursor back;
+                    # once it is completed, the next reconciliation scan picks it up
+                    if any(cell.strip() for cell in row):
+                        log_error(f"⚠️ Skipping sheet row {first_row + offset + 2}: name or email is blank.")
+                    row_ids.append(None)
                     continue
-
-                upload_file_to_drive(drive_service, qr_path, qr_codes_folder_id, qr_filename)
-                upload_file_to_drive(drive_service, ticket_path, tickets_folder_id, ticket_filename)
-
-                update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Generated")
-                mongo_client.update_attendee_field(attendee_id, config.COL_TICKET_STATUS, "Generated")
-                update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES[config.COL_EMAIL_STATUS], "Sending...")
-                mongo_client.update_attendee_field(attendee_id, config.COL_EMAIL_STATUS, "Sending...")
-
-                if send_ticket_email(email, name, ticket_path):
-                    update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES[config.COL_TICKET_STATUS], "Sent")
-                    update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES[config.COL_EMAIL_STATUS], "Sent")
-                    mongo_client.update_attendee_field(attendee_id, config.COL_TICKET_STATUS, "Sent")
-                    mongo_client.update_attendee_field(attendee_id, config.COL_EMAIL_STATUS, "Sent")
-                else:
-                    update_sheet_cell(sheets_service, spreadsheet_id, config.MAIN_SHEET_NAME, i, COLUMN_INDICES[config.COL_EMAIL_STATUS], "Failed (Email)")
-                    mongo_client.update_attendee_field(attendee_id, config.COL_EMAIL_STATUS, "Failed (Email)")
-
-                os.remove(qr_path)
-                os.remove(ticket_path)
-                print(f"✅ Cleaned up temp files for {name}.")
-
-            time.sleep(config.POLLING_INTERVAL_SECONDS)
+                # Rows are keyed by their Attendee ID; name-email is only used before one is assigned
+                row_ids.append(get_value_safe(row, attendee_id_idx).strip() or f"{name}-{email}")
+
+            # Claims are keyed by _id, so a row can only be taken once. The existing claims are
+            # read in one query; only rows without one cost an upsert. Failed rows are only
+            # retried by the reconciliation scan, so they do not pin every poll to a refetch
+            claim_states = mongo_client.claim_rows((row_id for row_id in row_ids if row_id), reclaim_failed=reconciling)
+            submitted_ids = set()
+
+            # One SMTP login serves every email sent in this cycle
+            with SMTPConnection() as smtp:
+                for offset, (row, row_unique_id) in enumerate(zip(sheet_data, row_ids)):
+                    if row_unique_id is None:
+                        row_results.append(True)
+                        continue
+                    # Rows claimed earlier count as finished unless they are still being processed;
+                    # a repeat of a row ID within this batch is left to the first row that has it
+                    claim_state = "processing" if row_unique_id in submitted_ids else claim_states[row_unique_id]
+                    if claim_state is not None:
+                        row_results.append(claim_state != "processing")
+                        continue
+                    submitted_ids.add(row_unique_id)
+
+                    i = first_row + offset
+                    if len(pending) >= MAX_PENDING_ROWS:
+                        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            row_id = pending.pop(future)
+                            if future.exception():
+                                log_error(f"❌ Unexpected error while processing '{row_id}': {future.exception()}")
+                    future = row_pool.submit(process_row, smtp, i, row, row_unique_id, headers, spreadsheet_id, tickets_folder_id, qr_codes_folder_id, known_attendees)
+                    pending[future] = row_unique_id
+                    row_results.append(future)
+
+                # Finish this cycle's rows before the sheet is read again
+                for future in concurrent.futures.as_completed(pending):
+                    if future.exception():
+                        log_error(f"❌ Unexpected error while processing '{pending[future]}': {future.exception()}")
+                pending.clear()
+
+            # Advance the high-water mark over the leading rows that are finished. Processed rows
+            # count even if they failed: their failed claim is retried by the next reconciliation
+            # scan (or after a restart), so one bad row cannot hold back incremental polling
+            finished = 0
+            for result in row_results:
+                if result is False:
+                    break
+                finished += 1
+            if first_row + finished != last_row:
+                last_row = first_row + finished
+                mongo_client.set_cursor(config.MAIN_SHEET_NAME, last_row)
+
+            # Rows still being processed force a fetch next time, even if the sheet is unchanged
+            seen_modified_time = modified_time if finished == len(row_results) else None
+            if any(isinstance(result, concurrent.futures.Future) for result in row_results):
+                idle_polls = 0
+            idle_polls = 0 if wait_for_next_poll(idle_polls) else idle_polls + 1
 
         except KeyboardInterrupt:
             print("\n🛑 Monitoring stopped by user. Exiting gracefully.")
@@ -487,6 +1087,9 @@ def main():
             print("Restarting monitoring after a short delay...")
             time.sleep(config.POLLING_INTERVAL_SECONDS * 2)
 
+    row_pool.shutdown(wait=True)
+    IO_POOL.shutdown(wait=True)
+
 # =============================================================================
 #  Part 4: Script Execution
 # =============================================================================
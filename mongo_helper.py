@@ -1,9 +1,12 @@
 # mongo_helper.py
 # This file contains a helper class for interacting with the MongoDB database.
 
-from pymongo import MongoClient
+import itertools
+from datetime import datetime, timezone
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import PyMongoError, BulkWriteError
 # Import column names from your config file to ensure consistency
-from config import MONGO_URI, MONGO_DB_NAME, MONGO_COLLECTION_NAME, COL_NAME, COL_EMAIL
+from config import MONGO_URI, MONGO_DB_NAME, MONGO_COLLECTION_NAME, COL_NAME, COL_EMAIL, COL_TICKET_STATUS, COL_EMAIL_STATUS
 
 class MongoDBClient:
     def __init__(self):
@@ -16,6 +19,13 @@ class MongoDBClient:
             self.client = MongoClient(MONGO_URI)
             self.db = self.client[MONGO_DB_NAME]
             self.collection = self.db[MONGO_COLLECTION_NAME]
+            # Bumped on every attendee write so cached API responses know when to rebuild
+            self._write_counter = itertools.count(1)
+            self.data_version = 0
+            # Holds the polling high-water mark for each sheet
+            self.sync_state = self.db[f"{MONGO_COLLECTION_NAME}_sync_state"]
+            # One document per claimed row, keyed by its row ID (attendee ID or name-email)
+            self.processed = self.db[f"{MONGO_COLLECTION_NAME}_processed"]
             # Test the connection on initialization
             self.client.admin.command('ping')
             print("[MongoDB] Connection successful.")
@@ -23,16 +33,30 @@ class MongoDBClient:
             print(f"[MongoDB] ERROR: Could not connect to MongoDB: {e}")
             exit(1)
 
-    def find_attendee_by_email_and_name(self, email: str, name: str):
+    def ensure_indexes(self):
         """
-        Finds a single attendee document by matching both their email and name,
-        using the specific column headers defined in config.py.
+        Creates the indexes behind the attendee lookups. This is a no-op when they
+        already exist, so it is safe to call on every startup.
         """
-        query = {
-            COL_EMAIL: email,
-            COL_NAME: name
-        }
-        return self.collection.find_one(query)
+        try:
+            self.collection.create_index([("attendee_id", ASCENDING)], unique=True)
+            self.collection.create_index([(COL_EMAIL, ASCENDING), (COL_NAME, ASCENDING)])
+            # Serves the /unsent filter; partial indexes cannot express "$ne: Sent"
+            self.collection.create_index([(COL_EMAIL_STATUS, ASCENDING)])
+            print("[MongoDB] Indexes are in place.")
+        except PyMongoError as e:
+            # e.g. duplicate attendee IDs already stored; lookups still work, just slower
+            print(f"[MongoDB] WARNING: Could not create indexes: {e}")
+
+    def find_attendees_for_rows(self, attendee_ids, emails) -> list:
+        """
+        Fetches, in one query, the attendees matching any of the given IDs or emails.
+        Only the ID, name, email and ticket status are returned.
+        """
+        return list(self.collection.find(
+            {"$or": [{"attendee_id": {"$in": list(attendee_ids)}}, {COL_EMAIL: {"$in": list(emails)}}]},
+            projection={"_id": 0, "attendee_id": 1, COL_NAME: 1, COL_EMAIL: 1, COL_TICKET_STATUS: 1}
+        ))
 
     def insert_full_attendee(self, attendee_data: dict):
         """
@@ -40,6 +64,7 @@ class MongoDBClient:
         The data is passed as a complete dictionary.
         """
         self.collection.insert_one(attendee_data)
+        self.data_version = next(self._write_counter)
         print(f"[MongoDB] Inserted new attendee: {attendee_data.get('Name')} ({attendee_data.get('attendee_id')})")
 
     # --- NEW: Generic function to update any field for an attendee ---
@@ -52,16 +77,120 @@ class MongoDBClient:
             {"attendee_id": attendee_id},
             {"$set": {field_name: new_value}}
         )
+        self.data_version = next(self._write_counter)
         print(f"[MongoDB] Updated '{field_name}' for {attendee_id} → {new_value}")
 
+    def update_attendee_fields(self, attendee_id: str, fields: dict):
+        """Updates several fields of an attendee in a single write."""
+        self.collection.update_one(
+            {"attendee_id": attendee_id},
+            {"$set": fields}
+        )
+        self.data_version = next(self._write_counter)
+        print(f"[MongoDB] Updated {', '.join(f'{k!r} → {v}' for k, v in fields.items())} for {attendee_id}")
+
     def get_attendee(self, attendee_id: str):
         """Retrieves a single attendee document by their unique attendee_id."""
         return self.collection.find_one({"attendee_id": attendee_id})
     
-    def find_attendees_by_query(self, query: dict):
+    def find_attendees_by_query(self, query: dict, projection: dict | None = None):
         """
         Finds attendees based on a flexible query.
         To get all attendees, pass an empty dictionary: {}.
+        An optional projection limits the fields MongoDB sends back.
         """
         # The .find() method returns a cursor, so we convert it to a list
-        return list(self.collection.find(query))
\ No newline at end of file
+        return list(self.collection.find(query, projection))
+
+    def load_processed_ids(self) -> set:
+        """Returns the attendee IDs whose tickets have already been sent."""
+        cursor = self.collection.find({COL_TICKET_STATUS: "Sent"}, {"_id": 0, "attendee_id": 1})
+        return {doc["attendee_id"] for doc in cursor if doc.get("attendee_id")}
+
+    def mark_processed(self, attendee_id: str):
+        """Marks an attendee's ticket and email as sent in a single write."""
+        self.collection.update_one(
+            {"attendee_id": attendee_id},
+            {"$set": {COL_TICKET_STATUS: "Sent", COL_EMAIL_STATUS: "Sent"}},
+            upsert=True
+        )
+        self.data_version = next(self._write_counter)
+        print(f"[MongoDB] Marked {attendee_id} as sent")
+
+    def get_cursor(self, sheet_name: str) -> int:
+        """Returns how many data rows of the sheet have been fully processed (0 if none)."""
+        state = self.sync_state.find_one({"_id": sheet_name})
+        return state.get("last_row", 0) if state else 0
+
+    def set_cursor(self, sheet_name: str, last_row: int):
+        """Stores the polling high-water mark for the sheet."""
+        self.sync_state.update_one({"_id": sheet_name}, {"$set": {"last_row": last_row}}, upsert=True)
+
+    def claim_row(self, row_unique_id: str) -> str | None:
+        """
+        Claims a row for processing in one atomic upsert on its _id. Returns None
+        if the row was claimed now, otherwise the state of the existing claim.
+        """
+        existing = self.processed.find_one_and_update(
+            {"_id": row_unique_id},
+            {"$setOnInsert": {"state": "processing", "ts": datetime.now(timezone.utc)}},
+            projection={"state": 1},
+            upsert=True
+        )
+        return existing.get("state") if existing else None
+
+    def claim_rows(self, row_unique_ids, reclaim_failed: bool = False) -> dict:
+        """
+        Claims a batch of rows. The existing claims are read in one query and only
+        the missing rows are upserted via claim_row; with 'reclaim_failed', failed
+        claims are taken again too. Returns {row_id: None if it was claimed now,
+        else the state of the existing claim}.
+        """
+        row_ids = list(dict.fromkeys(row_unique_ids))
+        if not row_ids:
+            return {}
+        states = {doc["_id"]: doc.get("state") for doc in self.processed.find({"_id": {"$in": row_ids}}, {"state": 1})}
+        claims = {}
+        for row_id in row_ids:
+            if row_id not in states:
+                claims[row_id] = self.claim_row(row_id)
+            elif reclaim_failed and states[row_id] == "failed":
+                claims[row_id] = None if self.reclaim_failed_row(row_id) else "processing"
+            else:
+                claims[row_id] = states[row_id]
+        return claims
+
+    def reclaim_failed_row(self, row_unique_id: str) -> bool:
+        """Atomically moves a failed claim back to 'processing'; returns True if this call took it."""
+        result = self.processed.update_one(
+            {"_id": row_unique_id, "state": "failed"},
+            {"$set": {"state": "processing", "ts": datetime.now(timezone.utc)}}
+        )
+        return result.modified_count == 1
+
+    def set_claim_state(self, row_unique_ids, state: str):
+        """Records how processing of the claimed rows ended ('sent' or 'failed')."""
+        self.processed.update_many(
+            {"_id": {"$in": list(row_unique_ids)}},
+            {"$set": {"state": state, "ts": datetime.now(timezone.utc)}}
+        )
+
+    def release_unfinished_claims(self) -> int:
+        """Drops claims of rows that failed or were interrupted, so they are retried."""
+        return self.processed.delete_many({"state": {"$ne": "sent"}}).deleted_count
+
+    def seed_sent_claims(self) -> int:
+        """Adds a 'sent' claim for every attendee already marked as sent; returns how many were new."""
+        processed_ids = self.load_processed_ids()
+        if not processed_ids:
+            return 0
+        now = datetime.now(timezone.utc)
+        try:
+            result = self.processed.insert_many(
+                [{"_id": attendee_id, "state": "sent", "ts": now} for attendee_id in processed_ids],
+                ordered=False
+            )
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Attendees that already have a claim are rejected as duplicates; the rest are inserted
+            return e.details.get("nInserted", 0)